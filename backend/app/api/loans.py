@@ -1,5 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.database import get_db
 from app.models.loan import Loan, Document
 from typing import List, Optional
@@ -8,21 +9,44 @@ router = APIRouter()
 
 @router.get("/")
 async def get_loans(
-    skip: int = 0,
+    after_id: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    loans = db.query(Loan).offset(skip).limit(limit).all()
-    return loans
+    # Keyset pagination walks the primary key index instead of scanning past an OFFSET.
+    # Rows come back as plain mappings, skipping ORM hydration on large pages.
+    result = await db.execute(
+        select(Loan.__table__)
+        .where(Loan.id > after_id)
+        .order_by(Loan.id)
+        .limit(limit)
+    )
+    loans = result.mappings().all()
+    
+    documents = {}
+    if loans:
+        result = await db.execute(
+            select(Document.__table__)
+            .where(Document.loan_id.in_([loan["id"] for loan in loans]))
+            .order_by(Document.id)
+        )
+        for document in result.mappings():
+            documents.setdefault(document["loan_id"], []).append(document)
+    
+    return {
+        "loans": [{**loan, "documents": documents.get(loan["id"], [])} for loan in loans],
+        "next_cursor": loans[-1]["id"] if loans else None
+    }
 
 @router.get("/{loan_id}")
-async def get_loan(loan_id: int, db: Session = Depends(get_db)):
-    loan = db.query(Loan).filter(Loan.id == loan_id).first()
+async def get_loan(loan_id: int, db: AsyncSession = Depends(get_db)):
+    loan = await db.get(Loan, loan_id)
     if not loan:
         raise HTTPException(status_code=404, detail="Loan not found")
     return loan
 
 @router.get("/{loan_id}/documents")
-async def get_loan_documents(loan_id: int, db: Session = Depends(get_db)):
-    documents = db.query(Document).filter(Document.loan_id == loan_id).all()
+async def get_loan_documents(loan_id: int, db: AsyncSession = Depends(get_db)):
+    result = await db.execute(select(Document).where(Document.loan_id == loan_id))
+    documents = result.scalars().all()
     return documents
\ No newline at end of file
@@ -1,6 +1,5 @@
-from fastapi import APIRouter, File, UploadFile, Depends, HTTPException
-from sqlalchemy.orm import Session
-from app.database import get_db
+from fastapi import APIRouter, File, UploadFile, HTTPException
+from app.database import SessionLocal
 from app.services.excel_processor import ExcelProcessor
 from app.services.pdf_processor import PDFProcessor
 import os
@@ -8,56 +7,70 @@ import tempfile
 
 router = APIRouter()
 
+# File size limit (50MB)
+MAX_FILE_SIZE = 50 * 1024 * 1024
+
+# Uploads are copied to disk in 1 MB chunks rather than buffered whole
+CHUNK_SIZE = 1 << 20
+
+async def _save_upload(file: UploadFile, temp_file):
+    # Content-Length is checked up front by middleware. Uploads without one
+    # (chunked) have already been spooled by Starlette's multipart parser by
+    # now, so this only stops oversized files from being copied and processed
+    size = 0
+    while chunk := await file.read(CHUNK_SIZE):
+        size += len(chunk)
+        if size > MAX_FILE_SIZE:
+            raise HTTPException(status_code=413, detail="File too large")
+        temp_file.write(chunk)
+    temp_file.flush()
+
 @router.post("/excel")
-async def upload_excel(
-    file: UploadFile = File(...),
-    db: Session = Depends(get_db)
-):
+async def upload_excel(file: UploadFile = File(...)):
     if not file.filename.endswith(('.xlsx', '.xls')):
         raise HTTPException(status_code=400, detail="Only Excel files are allowed")
     
     try:
         with tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx') as temp_file:
-            content = await file.read()
-            temp_file.write(content)
-            temp_file.flush()
-            
-            processor = ExcelProcessor(db)
-            result = await processor.process_file(temp_file.name)
-            
-            os.unlink(temp_file.name)
+            try:
+                await _save_upload(file, temp_file)
+                
+                processor = ExcelProcessor(SessionLocal)
+                result = await processor.process_file(temp_file.name)
+            finally:
+                os.unlink(temp_file.name)
             
             return {
                 "message": "Excel file processed successfully",
                 "loans_created": result["loans_created"],
                 "preview": result["preview"]
             }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/pdf")
-async def upload_pdf(
-    file: UploadFile = File(...),
-    db: Session = Depends(get_db)
-):
+async def upload_pdf(file: UploadFile = File(...)):
     if not file.filename.endswith('.pdf'):
         raise HTTPException(status_code=400, detail="Only PDF files are allowed")
     
     try:
         with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
-            content = await file.read()
-            temp_file.write(content)
-            temp_file.flush()
-            
-            processor = PDFProcessor(db)
-            result = await processor.process_file(temp_file.name)
-            
-            os.unlink(temp_file.name)
+            try:
+                await _save_upload(file, temp_file)
+                
+                processor = PDFProcessor()
+                result = await processor.process_file(temp_file.name)
+            finally:
+                os.unlink(temp_file.name)
             
             return {
                 "message": "PDF file processed successfully",
                 "document_data": result["document_data"],
                 "confidence": result["confidence"]
             }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Decimal, Date, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Numeric, Date, DateTime, ForeignKey
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -15,13 +15,13 @@ class Loan(Base):
     city = Column(String)
     state = Column(String)
     zip_code = Column(String)
-    loan_amount = Column(Decimal(15, 2))
-    interest_rate = Column(Decimal(5, 4))
+    loan_amount = Column(Numeric(15, 2))
+    interest_rate = Column(Numeric(5, 4))
     maturity_date = Column(Date)
     date_of_loan = Column(Date)
-    current_upb = Column(Decimal(15, 2))
-    accrued_interest = Column(Decimal(15, 2))
-    total_balance = Column(Decimal(15, 2))
+    current_upb = Column(Numeric(15, 2))
+    accrued_interest = Column(Numeric(15, 2))
+    total_balance = Column(Numeric(15, 2))
     last_paid_date = Column(Date)
     next_due_date = Column(Date)
     remaining_term = Column(Integer)
@@ -37,14 +37,14 @@ class Document(Base):
     __tablename__ = "documents"
     
     id = Column(Integer, primary_key=True, index=True)
-    loan_id = Column(Integer, ForeignKey("loans.id"))
+    loan_id = Column(Integer, ForeignKey("loans.id"), index=True)
     document_type = Column(String)
     recording_date = Column(Date)
     instrument_number = Column(String)
     original_lender = Column(String)
     assignor = Column(String)
     assignee = Column(String)
-    confidence_score = Column(Decimal(3, 2))
+    confidence_score = Column(Numeric(3, 2))
     created_at = Column(DateTime, default=datetime.utcnow)
     
     loan = relationship("Loan", back_populates="documents")
\ No newline at end of file
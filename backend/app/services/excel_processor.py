@@ -1,56 +1,235 @@
-import pandas as pd
-from sqlalchemy.orm import Session
+import anyio
+import numpy as np
+import openpyxl
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import async_sessionmaker
 from app.models.loan import Loan
-from difflib import get_close_matches
-from datetime import datetime
-from decimal import Decimal
+from rapidfuzz import fuzz, process
+from datetime import date, datetime
+from functools import lru_cache, partial
+from itertools import islice
 import logging
+import math
+import re
+
+# Rows read, coerced and inserted per batch; bounds peak memory and the
+# size of each executemany call.
+INSERT_BATCH_SIZE = 5000
+
+MONEY_FIELDS = ['loan_amount', 'current_upb', 'accrued_interest', 'total_balance']
+DATE_FIELDS = ['maturity_date', 'date_of_loan', 'last_paid_date', 'next_due_date']
+
+# Minimum token-set score (0-100) for a header to be mapped to a field. A
+# score of 100 only means one token set contains the other, so those matches
+# are further checked by _is_subset_match.
+MATCH_THRESHOLD = 90
+
+# Header words that add no meaning next to a single-word alias ("Mortgagor Name")
+GENERIC_HEADER_TOKENS = {'name', 'amount', 'date', 'number', 'no', 'code'}
+
+COLUMN_MAPPING = {
+    'borrower_name': ['borrower', 'borrower name', 'borrower_name', 'primary borrower', 'mortgagor'],
+    'co_borrower_name': ['co-borrower', 'co borrower', 'co_borrower', 'secondary borrower', 'co-mortgagor'],
+    'address': ['address', 'property address', 'street address', 'property_address'],
+    'city': ['city'],
+    'state': ['state', 'st'],
+    'zip_code': ['zip', 'zip code', 'zipcode', 'postal code'],
+    'loan_amount': ['loan amount', 'original balance', 'principal amount', 'loan_amount'],
+    'interest_rate': ['interest rate', 'rate', 'int rate', 'interest_rate'],
+    'maturity_date': ['maturity date', 'due date', 'maturity_date'],
+    'date_of_loan': ['loan date', 'origination date', 'date_of_loan'],
+    'current_upb': ['current balance', 'unpaid balance', 'current upb', 'upb'],
+    'accrued_interest': ['accrued interest', 'interest accrued'],
+    'total_balance': ['total balance', 'total amount due'],
+    'last_paid_date': ['last payment date', 'last paid', 'last_paid_date'],
+    'next_due_date': ['next due date', 'next payment date', 'next_due_date'],
+    'remaining_term': ['remaining term', 'months remaining'],
+    'legal_status': ['status', 'legal status', 'loan status'],
+    'lien_position': ['lien position', 'position'],
+    'investor_name': ['investor', 'investor name', 'owner']
+}
+
+def _normalize_header(name):
+    if name is None:
+        return ''
+    return ' '.join(re.sub(r'[^0-9a-z]+', ' ', str(name).lower()).split())
+
+def _flatten_aliases():
+    aliases = []
+    alias_rows = {}
+    for field, possible_names in COLUMN_MAPPING.items():
+        start = len(aliases)
+        aliases.extend(_normalize_header(name) for name in possible_names)
+        alias_rows[field] = slice(start, len(aliases))
+    return aliases, alias_rows
+
+def _is_subset_match(alias, header):
+    alias_tokens = set(alias.split())
+    header_tokens = set(header.split())
+    if not alias_tokens <= header_tokens:
+        return False
+    # A lone generic alias ("owner", "status") inside a longer header is only
+    # trusted when the rest is filler, so "Owner Occupied" is not an investor
+    return len(alias_tokens) > 1 or header_tokens - alias_tokens <= GENERIC_HEADER_TOKENS
+
+# Flattened once so every header can be scored in a single cdist call
+_ALIASES, _ALIAS_ROWS = _flatten_aliases()
+
+# Tapes from the same servicer share a header layout, so the field -> header
+# position mapping is memoized on the normalized header signature
+@lru_cache(maxsize=256)
+def _resolve_mapping(headers):
+    mapped = {}
+    if not headers:
+        return mapped
+    
+    scores = process.cdist(_ALIASES, headers, scorer=fuzz.token_set_ratio, dtype=np.uint8)
+    closeness = process.cdist(_ALIASES, headers, scorer=fuzz.ratio)
+    
+    candidates = []
+    for field, rows in _ALIAS_ROWS.items():
+        for row in range(rows.start, rows.stop):
+            for index in np.flatnonzero(scores[row] >= MATCH_THRESHOLD):
+                score = scores[row, index]
+                if score == 100 and not _is_subset_match(_ALIASES[row], headers[index]):
+                    continue
+                candidates.append((score, closeness[row, index], field, int(index)))
+    
+    # Token-set scoring also rewards subsets ("borrower" vs "co borrower name"),
+    # so hand out each header once, strongest and closest match first
+    used_columns = set()
+    for _, _, field, index in sorted(candidates, key=lambda c: (c[0], c[1]), reverse=True):
+        if field in mapped or index in used_columns:
+            continue
+        mapped[field] = index
+        used_columns.add(index)
+    
+    return mapped
+
+def _to_float(value):
+    if value is None:
+        return None
+    if type(value) in (int, float):
+        number = float(value)
+    else:
+        try:
+            number = float(str(value).replace('$', '').replace(',', ''))
+        except ValueError:
+            return None
+    return number if math.isfinite(number) else None
+
+def _to_money(value):
+    number = _to_float(value)
+    return round(number, 2) if number is not None else None
+
+def _to_rate(value):
+    rate = _to_float(value)
+    if rate is None:
+        return None
+    return round(rate / 100 if rate > 1 else rate, 4)
+
+def _to_int(value):
+    number = _to_float(value)
+    return int(number) if number is not None else None
+
+def _to_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value.strip()).date()
+        except ValueError:
+            return None
+    return None
+
+def _cell_expression(field, index):
+    # Common cell types are handled inline; everything else goes to a helper
+    cell = f"r[{index}]"
+    if field in MONEY_FIELDS:
+        return f"(round({cell}, 2) if type({cell}) in (int, float) else _to_money({cell}))"
+    if field == 'interest_rate':
+        return f"_to_rate({cell})"
+    if field in DATE_FIELDS:
+        return f"({cell}.date() if type({cell}) is datetime else _to_date({cell}))"
+    if field == 'remaining_term':
+        return f"_to_int({cell})"
+    return f"(str({cell}).strip() if {cell} else None)"
+
+# Generates a row extractor specialized to one header mapping: each field is a
+# fixed tuple index with its conversion inlined, so the per-row loop has no
+# mapping lookups or type dispatch. Only field names from COLUMN_MAPPING and
+# integer positions are templated into the source, never sheet content.
+@lru_cache(maxsize=256)
+def _compile_extractor(mapping):
+    width = max(index for _, index in mapping) + 1
+    entries = "".join(f"\n            {field!r}: {_cell_expression(field, index)}," for field, index in mapping)
+    source = f"""
+def extract_rows(rows):
+    loans = []
+    for r in rows:
+        # Read-only rows can be ragged when the sheet has no stored dimensions
+        if len(r) < {width}:
+            r = r + (None,) * ({width} - len(r))
+        loan = {{{entries}
+        }}
+        if any(loan.values()):
+            loans.append(loan)
+    return loans
+"""
+    namespace = {
+        'datetime': datetime,
+        '_to_money': _to_money,
+        '_to_rate': _to_rate,
+        '_to_int': _to_int,
+        '_to_date': _to_date,
+    }
+    exec(source, namespace)
+    return namespace['extract_rows']
+
+def _read_chunk(rows, extract_rows):
+    chunk = list(islice(rows, INSERT_BATCH_SIZE))
+    return extract_rows(chunk) if chunk else None
 
 class ExcelProcessor:
-    def __init__(self, db: Session):
-        self.db = db
-        self.column_mapping = {
-            'borrower_name': ['borrower', 'borrower name', 'borrower_name', 'primary borrower', 'mortgagor'],
-            'co_borrower_name': ['co-borrower', 'co borrower', 'co_borrower', 'secondary borrower', 'co-mortgagor'],
-            'address': ['address', 'property address', 'street address', 'property_address'],
-            'city': ['city'],
-            'state': ['state', 'st'],
-            'zip_code': ['zip', 'zip code', 'zipcode', 'postal code'],
-            'loan_amount': ['loan amount', 'original balance', 'principal amount', 'loan_amount'],
-            'interest_rate': ['interest rate', 'rate', 'int rate', 'interest_rate'],
-            'maturity_date': ['maturity date', 'due date', 'maturity_date'],
-            'date_of_loan': ['loan date', 'origination date', 'date_of_loan'],
-            'current_upb': ['current balance', 'unpaid balance', 'current upb', 'upb'],
-            'accrued_interest': ['accrued interest', 'interest accrued'],
-            'total_balance': ['total balance', 'total amount due'],
-            'last_paid_date': ['last payment date', 'last paid', 'last_paid_date'],
-            'next_due_date': ['next due date', 'next payment date', 'next_due_date'],
-            'remaining_term': ['remaining term', 'months remaining'],
-            'legal_status': ['status', 'legal status', 'loan status'],
-            'lien_position': ['lien position', 'position'],
-            'investor_name': ['investor', 'investor name', 'owner']
-        }
+    def __init__(self, session_factory: async_sessionmaker):
+        self.session_factory = session_factory
 
     async def process_file(self, file_path: str):
         try:
-            df = pd.read_excel(file_path)
-            
-            mapped_columns = self._map_columns(df.columns)
-            
-            loans_created = 0
-            preview_data = []
+            workbook = await anyio.to_thread.run_sync(
+                partial(openpyxl.load_workbook, file_path, read_only=True, data_only=True)
+            )
             
-            for _, row in df.iterrows():
-                loan_data = self._extract_loan_data(row, mapped_columns)
-                if loan_data:
-                    loan = Loan(**loan_data)
-                    self.db.add(loan)
-                    loans_created += 1
+            try:
+                rows = workbook.active.iter_rows(values_only=True)
+                headers = await anyio.to_thread.run_sync(next, rows, None) or ()
+                
+                mapped_columns = self._map_columns(headers)
+                
+                loans_created = 0
+                preview_data = []
+                
+                if mapped_columns:
+                    extract_rows = _compile_extractor(tuple(mapped_columns.items()))
+                    read_chunk = partial(anyio.to_thread.run_sync, _read_chunk, rows, extract_rows)
                     
-                    if len(preview_data) < 5:
-                        preview_data.append(loan_data)
-            
-            self.db.commit()
+                    # The preview comes from the first chunk, leaving the loop a pure insert path
+                    loan_dicts = await read_chunk()
+                    preview_data = (loan_dicts or [])[:5]
+                    
+                    # Stream the sheet so only one chunk of rows is held at a time. The
+                    # session, and its pooled connection, only lives for the inserts
+                    # and is released before the response is serialized.
+                    async with self.session_factory() as db:
+                        while loan_dicts is not None:
+                            loans_created += await self._bulk_insert(db, loan_dicts)
+                            loan_dicts = await read_chunk()
+                        
+                        await db.commit()
+            finally:
+                workbook.close()
             
             return {
                 "loans_created": loans_created,
@@ -58,73 +237,18 @@ class ExcelProcessor:
             }
             
         except Exception as e:
-            self.db.rollback()
+            # Closing the session without a commit rolls back any inserted batches
             logging.error(f"Error processing Excel file: {str(e)}")
             raise e
 
-    def _map_columns(self, columns):
-        mapped = {}
-        columns_lower = [col.lower().strip() for col in columns]
-        
-        for field, possible_names in self.column_mapping.items():
-            best_match = None
-            best_score = 0
-            
-            for col_name in possible_names:
-                matches = get_close_matches(col_name.lower(), columns_lower, n=1, cutoff=0.6)
-                if matches:
-                    score = self._similarity_score(col_name.lower(), matches[0])
-                    if score > best_score:
-                        best_match = columns[columns_lower.index(matches[0])]
-                        best_score = score
-            
-            if best_match:
-                mapped[field] = best_match
-        
-        return mapped
-
-    def _similarity_score(self, a, b):
-        return len(set(a) & set(b)) / len(set(a) | set(b))
+    async def _bulk_insert(self, db, loan_dicts):
+        # Chunks are already capped at INSERT_BATCH_SIZE by _read_chunk; a list
+        # of dicts makes this an executemany that asyncpg pipelines
+        if not loan_dicts:
+            return 0
+        await db.execute(insert(Loan), loan_dicts)
+        return len(loan_dicts)
 
-    def _extract_loan_data(self, row, mapped_columns):
-        try:
-            loan_data = {}
-            
-            for field, column in mapped_columns.items():
-                if column in row.index and pd.notna(row[column]):
-                    value = row[column]
-                    
-                    if field in ['loan_amount', 'current_upb', 'accrued_interest', 'total_balance']:
-                        try:
-                            loan_data[field] = Decimal(str(float(value)))
-                        except (ValueError, TypeError):
-                            loan_data[field] = None
-                    elif field == 'interest_rate':
-                        try:
-                            rate = float(value)
-                            if rate > 1:
-                                rate = rate / 100
-                            loan_data[field] = Decimal(str(rate))
-                        except (ValueError, TypeError):
-                            loan_data[field] = None
-                    elif field in ['maturity_date', 'date_of_loan', 'last_paid_date', 'next_due_date']:
-                        try:
-                            if isinstance(value, str):
-                                loan_data[field] = datetime.strptime(value, '%Y-%m-%d').date()
-                            else:
-                                loan_data[field] = value.date() if hasattr(value, 'date') else value
-                        except (ValueError, TypeError):
-                            loan_data[field] = None
-                    elif field == 'remaining_term':
-                        try:
-                            loan_data[field] = int(float(value))
-                        except (ValueError, TypeError):
-                            loan_data[field] = None
-                    else:
-                        loan_data[field] = str(value).strip() if value else None
-            
-            return loan_data if any(loan_data.values()) else None
-            
-        except Exception as e:
-            logging.error(f"Error extracting loan data from row: {str(e)}")
-            return None
\ No newline at end of file
+    def _map_columns(self, headers):
+        # Fields map to header positions, which index the row tuples directly
+        return dict(_resolve_mapping(tuple(_normalize_header(header) for header in headers)))
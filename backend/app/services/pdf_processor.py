@@ -1,26 +1,140 @@
-import PyPDF2
-import openai
+import fitz
+from openai import AsyncOpenAI
 import json
 import os
-from sqlalchemy.orm import Session
 from app.models.loan import Document
-from datetime import datetime
+from app.workers import get_process_pool
+from datetime import date
 from decimal import Decimal
+from functools import lru_cache
+import asyncio
 import logging
+import re
+
+# Only this much document text is sent to the model
+PROMPT_TEXT_LIMIT = 4000
+# Scanned PDFs yield no text, so the character budget alone never stops them
+PROMPT_PAGE_LIMIT = 10
+
+# Module-level so it can be pickled into the PDF process pool
+def _extract_text_from_pdf(file_path: str):
+    try:
+        with fitz.open(file_path) as pdf:
+            pages = []
+            length = 0
+            
+            for page in pdf.pages(0, min(PROMPT_PAGE_LIMIT, pdf.page_count)):
+                text = page.get_text("text")
+                pages.append(text)
+                length += len(text) + 1
+                # Later pages would be cut from the prompt anyway
+                if length >= PROMPT_TEXT_LIMIT:
+                    break
+            
+            return "\n".join(pages)
+            
+    except Exception as e:
+        logging.error(f"Error extracting text from PDF: {str(e)}")
+        raise e
+
+OPENAI_MODEL = "gpt-4o-mini"
+
+def _nullable(type_, description):
+    return {"type": [type_, "null"], "description": description}
+
+# Forcing a call to this function makes the model return schema-shaped JSON
+# arguments, so no markdown stripping is needed
+LOAN_DOCUMENT_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "emit_loan_document",
+        "description": "Record the structured data extracted from a loan document.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "document_type": _nullable("string", "The type of document (note, mortgage, assignment, allonge, etc.)"),
+                "borrower_name": _nullable("string", "Primary borrower name"),
+                "co_borrower_name": _nullable("string", "Co-borrower name if present"),
+                "date_of_loan": _nullable("string", "Date when the loan was originated, YYYY-MM-DD"),
+                "recording_date": _nullable("string", "Date when the document was recorded, YYYY-MM-DD"),
+                "instrument_number": _nullable("string", "Recording or instrument number"),
+                "property_address": _nullable("string", "Street address of the property"),
+                "city": _nullable("string", "Property city"),
+                "state": _nullable("string", "Property state"),
+                "zip_code": _nullable("string", "Property zip code"),
+                "loan_amount": _nullable("number", "Original loan amount"),
+                "interest_rate": _nullable("number", "Interest rate as a decimal, e.g. 0.05 for 5%"),
+                "maturity_date": _nullable("string", "Loan maturity date, YYYY-MM-DD"),
+                "original_lender": _nullable("string", "Original lender name"),
+                "assignor": _nullable("string", "Entity assigning the loan (if assignment document)"),
+                "assignee": _nullable("string", "Entity receiving the assignment (if assignment document)"),
+                "confidence": {"type": "number", "description": "Your confidence in the extraction (0.0 to 1.0)"}
+            },
+            "required": ["document_type", "confidence"]
+        }
+    }
+}
+
+# Shared so every upload reuses one HTTP connection pool
+@lru_cache(maxsize=1)
+def _openai_client():
+    return AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 class PDFProcessor:
-    def __init__(self, db: Session):
-        self.db = db
-        openai.api_key = os.getenv("OPENAI_API_KEY")
+    # Compiled once at import and reused by every upload. Every pattern is
+    # anchored to a label the standard note, mortgage and assignment templates
+    # use; anything less specific is left to the model.
+    DOCUMENT_TYPE_PATTERN = re.compile(
+        r"\b(assignment|allonge|deed of trust|mortgage|promissory note|note)\b", re.IGNORECASE
+    )
+    # The title sits at the top of the document; later mentions are references
+    # to other instruments
+    DOCUMENT_TITLE_CHARS = 500
+    NAME = r"([A-Z][A-Za-z.'-]*(?:[ \t]+[A-Z][A-Za-z.'-]*)+)"
+    BORROWER_PATTERN = re.compile(
+        r"\b(?:Borrower|BORROWER|Mortgagor|MORTGAGOR)(?:\(s\))?(?:[ \t]*:|[ \t]+is)[ \t]+" + NAME
+    )
+    ASSIGNOR_PATTERN = re.compile(r"^[ \t]*(?i:assignor)[ \t]*:[ \t]*(\S[^\n]*?)[ \t]*$", re.MULTILINE)
+    ASSIGNEE_PATTERN = re.compile(r"^[ \t]*(?i:assignee)[ \t]*:[ \t]*(\S[^\n]*?)[ \t]*$", re.MULTILINE)
+    AMOUNT_PATTERN = re.compile(
+        r"(?:principal[ \t]+(?:amount|sum)[ \t]+of|\bsum[ \t]+of)[^$\n]{0,100}\$[ \t]?([\d,]+\.\d{2})",
+        re.IGNORECASE
+    )
+    RATE_PATTERN = re.compile(
+        r"\b(?:interest|yearly|annual)[ \t]+rate[ \t]+of[ \t]+(\d{1,2}(?:\.\d+)?)[ \t]?%", re.IGNORECASE
+    )
+    DATE_PATTERN = re.compile(
+        r"(?:\bdated(?:[ \t]+as[ \t]+of)?|^[ \t]*Date[ \t]*:)[ \t]*(?:(\d{4})-(\d{2})-(\d{2})|(\d{1,2})/(\d{1,2})/(\d{4}))\b",
+        re.IGNORECASE | re.MULTILINE
+    )
+    
+    # The OpenAI call is skipped only when every field required for the
+    # document type was found. Assignments and allonges are about who holds
+    # the loan, so they need both parties; their "dated" line is the transfer
+    # date, not the loan date, and is not used.
+    REGEX_REQUIRED_FIELDS = {
+        'note': {'borrower_name', 'loan_amount', 'date_of_loan'},
+        'mortgage': {'borrower_name', 'loan_amount', 'date_of_loan'},
+        'deed of trust': {'borrower_name', 'loan_amount', 'date_of_loan'},
+        'assignment': {'assignor', 'assignee'},
+        'allonge': {'assignor', 'assignee'},
+    }
+    REGEX_CONFIDENCE = 0.8
 
     async def process_file(self, file_path: str):
         try:
-            text_content = self._extract_text_from_pdf(file_path)
+            loop = asyncio.get_running_loop()
+            text_content = await loop.run_in_executor(get_process_pool(), _extract_text_from_pdf, file_path)
             
             if not text_content.strip():
                 raise ValueError("No text content extracted from PDF")
 
-            extracted_data = await self._extract_data_with_openai(text_content)
+            extracted_data = self._regex_extract(text_content)
+            required_fields = self.REGEX_REQUIRED_FIELDS.get(extracted_data.get("document_type"))
+            if required_fields and required_fields.issubset(extracted_data):
+                extracted_data["confidence"] = self.REGEX_CONFIDENCE
+            else:
+                extracted_data = await self._extract_data_with_openai(text_content)
             
             document_data = self._process_extracted_data(extracted_data)
             
@@ -33,79 +147,78 @@ class PDFProcessor:
             logging.error(f"Error processing PDF file: {str(e)}")
             raise e
 
-    def _extract_text_from_pdf(self, file_path: str):
-        try:
-            with open(file_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                text = ""
-                
-                for page in pdf_reader.pages:
-                    text += page.extract_text() + "\n"
-                
-                return text
-                
-        except Exception as e:
-            logging.error(f"Error extracting text from PDF: {str(e)}")
-            raise e
+    def _regex_extract(self, text_content: str):
+        extracted = {}
+        
+        document_type = self.DOCUMENT_TYPE_PATTERN.search(text_content[:self.DOCUMENT_TITLE_CHARS])
+        if document_type:
+            document_type = document_type.group(1).lower()
+            extracted["document_type"] = "note" if document_type == "promissory note" else document_type
+        
+        for field, pattern in (
+            ("borrower_name", self.BORROWER_PATTERN),
+            ("assignor", self.ASSIGNOR_PATTERN),
+            ("assignee", self.ASSIGNEE_PATTERN),
+            ("loan_amount", self.AMOUNT_PATTERN),
+            ("interest_rate", self.RATE_PATTERN),
+        ):
+            match = pattern.search(text_content)
+            if match:
+                extracted[field] = match.group(1)
+        
+        for field in ("borrower_name", "assignor", "assignee"):
+            if field in extracted:
+                extracted[field] = extracted[field].rstrip(".,;:")
+        
+        # The pattern requires a percent sign; store the rate as a decimal
+        if "interest_rate" in extracted:
+            extracted["interest_rate"] = str(Decimal(extracted["interest_rate"]) / 100)
+        
+        if extracted.get("document_type") not in ("assignment", "allonge"):
+            match = self.DATE_PATTERN.search(text_content)
+            if match:
+                year, month, day = match.group(1, 2, 3) if match.group(1) else match.group(6, 4, 5)
+                try:
+                    extracted["date_of_loan"] = date(int(year), int(month), int(day)).isoformat()
+                except ValueError:
+                    # Out-of-range dates like 13/45/2020 are left to the OpenAI call
+                    pass
+        
+        return extracted
 
     async def _extract_data_with_openai(self, text_content: str):
         try:
             prompt = f"""
-            Extract structured data from this loan document. Return a JSON object with the following fields:
-            
-            - document_type: The type of document (note, mortgage, assignment, allonge, etc.)
-            - borrower_name: Primary borrower name
-            - co_borrower_name: Co-borrower name if present
-            - date_of_loan: Date when the loan was originated
-            - recording_date: Date when the document was recorded
-            - instrument_number: Recording or instrument number
-            - property_address: Full property address (split into components if possible)
-            - city: Property city
-            - state: Property state
-            - zip_code: Property zip code
-            - loan_amount: Original loan amount
-            - interest_rate: Interest rate (as decimal, e.g., 0.05 for 5%)
-            - maturity_date: Loan maturity date
-            - original_lender: Original lender name
-            - assignor: Entity assigning the loan (if assignment document)
-            - assignee: Entity receiving the assignment (if assignment document)
-            - confidence: Your confidence in the extraction (0.0 to 1.0)
+            Extract structured data from this loan document.
             
             If a field is not found or unclear, set it to null. For dates, use YYYY-MM-DD format.
             For multiple assignments, provide the most recent assignor and assignee.
             
             Document text:
-            {text_content[:4000]}  # Limit to first 4000 chars to stay within token limits
-            
-            Return only valid JSON:
+            {text_content[:PROMPT_TEXT_LIMIT]}
             """
 
-            response = openai.ChatCompletion.create(
-                model="gpt-4",
+            response = await _openai_client().chat.completions.create(
+                model=OPENAI_MODEL,
                 messages=[
-                    {"role": "system", "content": "You are an expert at extracting structured data from loan documents. Always return valid JSON."},
+                    {"role": "system", "content": "You are an expert at extracting structured data from loan documents."},
                     {"role": "user", "content": prompt}
                 ],
+                tools=[LOAN_DOCUMENT_TOOL],
+                tool_choice={"type": "function", "function": {"name": "emit_loan_document"}},
                 temperature=0.1,
                 max_tokens=1000
             )
             
-            content = response.choices[0].message.content.strip()
+            arguments = response.choices[0].message.tool_calls[0].function.arguments
             
-            # Try to extract JSON from the response
             try:
-                # Remove any markdown code block formatting
-                if content.startswith("```json"):
-                    content = content[7:]
-                if content.endswith("```"):
-                    content = content[:-3]
-                
-                extracted_data = json.loads(content)
-                return extracted_data
+                return json.loads(arguments)
                 
             except json.JSONDecodeError as e:
+                # Only reachable if the arguments were cut off by max_tokens
                 logging.error(f"Failed to parse OpenAI response as JSON: {e}")
-                logging.error(f"Response content: {content}")
+                logging.error(f"Response content: {arguments}")
                 
                 # Return a basic structure with low confidence
                 return {
@@ -129,7 +242,7 @@ class PDFProcessor:
                 elif field in ['date_of_loan', 'recording_date', 'maturity_date']:
                     try:
                         if isinstance(value, str) and value:
-                            processed[field] = datetime.strptime(value, '%Y-%m-%d').date()
+                            processed[field] = date.fromisoformat(value)
                         else:
                             processed[field] = None
                     except ValueError:
@@ -0,0 +1,30 @@
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
+
+# Bounded per uvicorn worker so several app processes don't each spawn one
+# PDF process per CPU
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", "2"))
+
+process_pool = None
+
+def start_process_pool():
+    global process_pool
+    if process_pool is None:
+        # Workers are only started on the first PDF upload, when the event loop
+        # and anyio threads are running; forking then can deadlock, so they
+        # come from a clean forkserver instead
+        process_pool = ProcessPoolExecutor(
+            max_workers=PDF_WORKERS,
+            mp_context=multiprocessing.get_context("forkserver")
+        )
+
+def shutdown_process_pool():
+    global process_pool
+    if process_pool is not None:
+        process_pool.shutdown()
+        process_pool = None
+
+def get_process_pool():
+    # Falls back to the event loop's default thread pool outside the app
+    return process_pool
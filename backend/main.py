@@ -1,8 +1,10 @@
 from fastapi import FastAPI, File, UploadFile, Depends, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
-from sqlalchemy.orm import Session
-from app.database import get_db, create_tables
+from app.database import create_tables
+from app.workers import start_process_pool, shutdown_process_pool
 from app.api import upload, loans
 import os
 import logging
@@ -12,6 +14,17 @@ load_dotenv()
 
 app = FastAPI(title="NPL Vision API", version="1.0.0")
 
+# Middleware registered later wraps middleware registered earlier, so this is
+# added first: CORS headers and request logging then apply to the 413 too
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    # Reject oversized uploads from the declared length, before the body is read
+    if request.method == "POST" and request.url.path.startswith("/api/upload"):
+        content_length = request.headers.get("content-length", "")
+        if content_length.isdigit() and int(content_length) > upload.MAX_FILE_SIZE:
+            return JSONResponse(status_code=413, content={"detail": "File too large"})
+    return await call_next(request)
+
 # Security middleware
 app.add_middleware(TrustedHostMiddleware, allowed_hosts=["localhost", "127.0.0.1"])
 
@@ -23,18 +36,21 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# File size limit (50MB)
-MAX_FILE_SIZE = 50 * 1024 * 1024
-
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
-    logger.info(f"Request: {request.method} {request.url}")
+    # Guarded and %-formatted so nothing is built when INFO is disabled
+    log_enabled = logger.isEnabledFor(logging.INFO)
+    if log_enabled:
+        logger.info("Request: %s %s", request.method, request.url.path)
     response = await call_next(request)
-    logger.info(f"Response: {response.status_code}")
+    if log_enabled:
+        logger.info("Response: %s", response.status_code)
     return response
 
 app.include_router(upload.router, prefix="/api/upload", tags=["upload"])
@@ -42,7 +58,12 @@ app.include_router(loans.router, prefix="/api/loans", tags=["loans"])
 
 @app.on_event("startup")
 async def startup_event():
-    create_tables()
+    await create_tables()
+    start_process_pool()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    shutdown_process_pool()
 
 @app.get("/")
 async def root():
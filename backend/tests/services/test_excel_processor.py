@@ -0,0 +1,49 @@
+from app.services.excel_processor import ExcelProcessor
+
+
+def map_headers(headers):
+    mapping = ExcelProcessor(None)._map_columns(headers)
+    return {field: headers[index] for field, index in mapping.items()}
+
+
+def test_maps_common_loan_headers():
+    headers = [
+        'Loan ID',
+        'Borrower Name',
+        'Co-Borrower Name',
+        'Property Address',
+        'Original Balance',
+        'Interest Rate',
+        'Current UPB',
+        'Accrued Interest',
+        'Next Due Date',
+        'Legal Status'
+    ]
+
+    result = map_headers(headers)
+
+    assert result['borrower_name'] == 'Borrower Name'
+    assert result['co_borrower_name'] == 'Co-Borrower Name'
+    assert result['address'] == 'Property Address'
+    assert result['loan_amount'] == 'Original Balance'
+    assert result['interest_rate'] == 'Interest Rate'
+    assert result['current_upb'] == 'Current UPB'
+    assert result['accrued_interest'] == 'Accrued Interest'
+    assert result['next_due_date'] == 'Next Due Date'
+    assert result['legal_status'] == 'Legal Status'
+    assert 'Loan ID' not in result.values()
+
+
+def test_leaves_fields_unmapped_without_a_matching_header():
+    result = map_headers(['Loan ID', 'Borrower First Name', 'Owner Occupied'])
+
+    assert 'date_of_loan' not in result
+    assert 'co_borrower_name' not in result
+    assert 'investor_name' not in result
+
+
+def test_single_word_alias_accepts_generic_suffix():
+    result = map_headers(['Mortgagor Name', 'Status'])
+
+    assert result['borrower_name'] == 'Mortgagor Name'
+    assert result['legal_status'] == 'Status'